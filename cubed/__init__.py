@@ -3,4 +3,4 @@ from .download import construct_file_df, generate_cube
 from .client import CubeClient, generate_client
 
 from .nc import dir_to_xarr
-from .date_glob import DateGlob
+from .date_glob import DateGlob, DateGlobSet
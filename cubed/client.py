@@ -1,18 +1,45 @@
 from pystac_client import Client
 from pystac_client.item_search import ItemSearch
 import geopandas as gpd
-from typing import Union, Any, Dict, Tuple
+from shapely.geometry import JOIN_STYLE, mapping, shape
+from typing import Union, Any, Dict, Iterable, List, Tuple
+from concurrent.futures import ThreadPoolExecutor
+from itertools import chain
 from pathlib import Path
+import threading
 import json
 
 from pystac_client.exceptions import APIError
 from pystac_client import Client
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
 import warnings
 
 # Type
 SingleGeom = Dict[str, Union[str, Tuple]]
 
+# Connection pool shared by all requests of a client
+POOL_SIZE = 32
+# Item searches are POSTed, which urllib3 does not retry by default
+RETRY = Retry(
+    total=5,
+    backoff_factor=0.5,
+    status_forcelist=(429, 502, 503, 504),
+    allowed_methods=Retry.DEFAULT_ALLOWED_METHODS | {"POST"},
+)
+
+# Item ids requested per search when fetching items by id
+ID_BATCH = 100
+
+# Open clients keyed by (catalog, url)
+_CLIENT_CACHE: Dict[Tuple[str, str], Client] = {}
+_CLIENT_LOCK = threading.Lock()
+
+# AOIs larger than this (deg^2) are simplified before being sent to the API
+SIMPLIFY_AREA = 0.01
+SIMPLIFY_TOLERANCE = 0.001
+
 
 class CubeClient(Client):
     """
@@ -23,13 +50,55 @@ class CubeClient(Client):
     def __init__(self, **kwargs: Any) -> None:
         super(Client, self).__init__(**kwargs)
 
-    def search(self, **kwargs: Any) -> ItemSearch:
+    def search(self, use_bbox: bool = False, **kwargs: Any) -> ItemSearch:
         # Wrap parent ItemSearch with geometry check
         if "intersects" in list(kwargs.keys()):
             geom = kwargs.get("intersects")
             kwargs["intersects"] = self.__check_intersects(geom)
+            # Submit only the bounds, avoiding server side polygon math
+            if use_bbox and kwargs["intersects"] is not None:
+                kwargs["bbox"] = shape(kwargs.pop("intersects")).bounds
         return super(CubeClient, self).search(**kwargs)
 
+    def fetch_items(
+        self, ids: Iterable[str], collections: Union[List[str], None] = None
+    ) -> List[Any]:
+        """Fetch items by id in batched searches
+
+        Parameters
+        ----------
+        ids : Iterable[str]
+            Item ids to fetch
+        collections : list, optional
+            Collections the items belong to
+
+        Returns
+        -------
+        list
+            Fetched pystac Items in the order of ids, ids not found are
+            skipped
+
+        Notes
+        -----
+            Ids are grouped into searches of ID_BATCH ids instead of one
+            request per item, the batches run concurrently over the
+            client's pooled session.
+        """
+        ids = list(ids)
+        batches = [ids[i : i + ID_BATCH] for i in range(0, len(ids), ID_BATCH)]
+        if not batches:
+            return []
+
+        def fetch(batch):
+            search = self.search(ids=batch, collections=collections)
+            return list(search.items())
+
+        with ThreadPoolExecutor(max_workers=min(POOL_SIZE, len(batches))) as ex:
+            items = list(chain.from_iterable(ex.map(fetch, batches)))
+        # Servers may return a batch in any order
+        position = {item_id: i for i, item_id in enumerate(ids)}
+        return sorted(items, key=lambda item: position[item.id])
+
     def __check_intersects(self, geom) -> Union[SingleGeom, None]:
         # Check if geom is geopandas dataframe object
         if isinstance(geom, gpd.GeoDataFrame):
@@ -42,7 +111,34 @@ class CubeClient(Client):
             return self.__get_subgeom(geo_json)
 
     def __get_subgeom(self, geom_json) -> SingleGeom:
-        return geom_json["features"][0]["geometry"]
+        return _simplify_subgeom(geom_json)
+
+
+def _simplify_subgeom(geom_json) -> SingleGeom:
+    """First feature geometry, simplified when large
+
+    Large AOIs produce big request bodies on every paginated request.
+    Simplifying moves the boundary by at most SIMPLIFY_TOLERANCE, so the
+    result is grown by the tolerance again (mitred, adding no round
+    vertices) to stay a superset of the original AOI.
+    """
+    geom = shape(geom_json["features"][0]["geometry"])
+    if geom.area > SIMPLIFY_AREA:
+        geom = geom.simplify(SIMPLIFY_TOLERANCE, preserve_topology=True).buffer(
+            SIMPLIFY_TOLERANCE, join_style=JOIN_STYLE.mitre
+        )
+    return mapping(geom)
+
+
+def _configure_session(client: Client) -> Client:
+    """Reuse pooled keep-alive connections across paginated STAC requests"""
+    session = client._stac_io.session
+    adapter = HTTPAdapter(
+        pool_connections=POOL_SIZE, pool_maxsize=POOL_SIZE, max_retries=RETRY
+    )
+    session.mount("https://", adapter)
+    session.headers["Connection"] = "keep-alive"
+    return client
 
 
 def generate_client(
@@ -64,12 +160,19 @@ def generate_client(
 
     Notes
     -----
-        Simply a wrapper for Client.open.
+        Simply a wrapper for Client.open. Clients are cached per catalog and
+        url so repeated calls share one connection pool, missing endpoints
+        are not cached.
         TODO: Add checking and indexing of NASA cmr catalogs
 
     """
-    try:
-        return CubeClient.open(f"{url}/{catalog}")
-    except APIError:
-        warnings.warn("STAC endpoint not found", RuntimeWarning)
-        return None
+    key = (catalog, url)
+    with _CLIENT_LOCK:
+        if key not in _CLIENT_CACHE:
+            try:
+                client = CubeClient.open(f"{url}/{catalog}")
+            except APIError:
+                warnings.warn("STAC endpoint not found", RuntimeWarning)
+                return None
+            _CLIENT_CACHE[key] = _configure_session(client)
+        return _CLIENT_CACHE[key]
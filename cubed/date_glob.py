@@ -1,32 +1,130 @@
 import re
+import fnmatch
 import datetime
+from functools import lru_cache
+from typing import Dict, Iterable, List
+
+try:
+    import hyperscan
+except ImportError:
+    hyperscan = None
+
+
+# strftime directive -> number of digits
+_DIRECTIVE_WIDTHS = {"Y": 4, "m": 2, "d": 2, "j": 3, "H": 2, "M": 2, "S": 2}
+_DIRECTIVE_RE = re.compile(f"%[{''.join(_DIRECTIVE_WIDTHS)}]")
+# Full directive -> glob character classes, built once at import
+_EXPANSIONS = {f"%{k}": "[0-9]" * v for k, v in _DIRECTIVE_WIDTHS.items()}
+# Characters that make a string more than a literal
+_SPECIAL_RE = re.compile(r"[%*?\[]")
 
 
 # ISO 8601
 class DateGlob:
-    def __init__(self, datestr) -> None:
-        self.datestr = datestr
-        self.__Y = "[0-9]" * 4
-        self.__m = "[0-9]" * 2
-        self.__d = "[0-9]" * 2
-        self.__j = "[0-9]" * 3
-        self.pattern = self.__parse_date()
-
-    def __parse_date(self):
-        self.__pattern = self.datestr
-        if "%Y" in self.datestr:
-            self.__replace_year()
-        if "%m" in self.__pattern:
-            self.__replace_month()
-        if "%d" in self.__pattern:
-            self.__replace_day()
-        return self.__pattern
-
-    def __replace_year(self):
-        self.__pattern = self.__pattern.replace("%Y", self.__Y)
-
-    def __replace_month(self):
-        self.__pattern = self.__pattern.replace("%m", self.__m)
-
-    def __replace_day(self):
-        self.__pattern = self.__pattern.replace("%d", self.__d)
+    """Glob pattern for a strftime date expression
+
+    Instances are immutable and shared, constructing a DateGlob for a date
+    expression seen before returns the cached instance.
+    """
+
+    __slots__ = ("datestr", "pattern", "_regex")
+
+    def __new__(cls, datestr):
+        return _date_glob(cls, datestr)
+
+    @property
+    def regex(self) -> re.Pattern:
+        """Compiled regex of the glob pattern, built on first use"""
+        if self._regex is None:
+            regex = re.compile(fnmatch.translate(self.pattern))
+            object.__setattr__(self, "_regex", regex)
+        return self._regex
+
+    compiled = regex
+
+    def match(self, name: str) -> bool:
+        """Whether name matches the glob pattern, using the compiled regex"""
+        return self.regex.match(name) is not None
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f"{type(self).__name__} is immutable")
+
+    def __reduce__(self):
+        # Copies and unpickled instances go back through the instance cache
+        return (type(self), (self.datestr,))
+
+
+class _LiteralDateGlob(DateGlob):
+    """DateGlob of an expression without directives or glob characters"""
+
+    __slots__ = ()
+
+    def match(self, name: str) -> bool:
+        return name == self.pattern
+
+    def __reduce__(self):
+        return (DateGlob, (self.datestr,))
+
+
+@lru_cache(maxsize=128)
+def _date_glob(cls, datestr):
+    # Literal expressions skip expansion and match without a regex, only for
+    # DateGlob itself so subclasses keep their own type
+    if cls is DateGlob and _SPECIAL_RE.search(datestr) is None:
+        glob = object.__new__(_LiteralDateGlob)
+        pattern = datestr
+    else:
+        glob = object.__new__(cls)
+        pattern = _parse_date(datestr)
+    object.__setattr__(glob, "datestr", datestr)
+    object.__setattr__(glob, "pattern", pattern)
+    object.__setattr__(glob, "_regex", None)
+    return glob
+
+
+def _parse_date(datestr):
+    # Single directive expressions are a plain lookup
+    if datestr in _EXPANSIONS:
+        return _EXPANSIONS[datestr]
+    return _DIRECTIVE_RE.sub(lambda m: _EXPANSIONS[m.group()], datestr)
+
+
+class DateGlobSet:
+    """Match names against several DateGlobs in one pass
+
+    Uses a hyperscan database when hyperscan is installed, otherwise a
+    single combined regex.
+    """
+
+    def __init__(self, globs: List[DateGlob]) -> None:
+        self.globs = list(globs)
+        if not self.globs:
+            raise ValueError("DateGlobSet requires at least one DateGlob")
+        if hyperscan is not None:
+            self.__db = hyperscan.Database()
+            self.__db.compile(
+                # Anchor at the start to match DateGlob.match semantics
+                expressions=[f"^{g.regex.pattern}".encode() for g in self.globs],
+                ids=list(range(len(self.globs))),
+                flags=[hyperscan.HS_FLAG_SINGLEMATCH] * len(self.globs),
+            )
+        else:
+            self.__regex = re.compile(
+                "|".join(
+                    f"(?P<g{i}>{g.regex.pattern})" for i, g in enumerate(self.globs)
+                )
+            )
+
+    def match(self, name: str) -> int:
+        """Index of the first DateGlob matching name, -1 if none match"""
+        if hyperscan is None:
+            m = self.__regex.match(name)
+            return -1 if m is None else int(m.lastgroup[1:])
+        found = []
+        self.__db.scan(name.encode(), match_event_handler=lambda i, *_: found.append(i))
+        return min(found, default=-1)
+
+    def match_all(self, names: Iterable[str]) -> Dict[str, int]:
+        """Map each matching name to the index of its first matching DateGlob"""
+        matches = ((name, self.match(name)) for name in names)
+        return {name: i for name, i in matches if i >= 0}
@@ -16,17 +16,28 @@
 import json
 from pathlib import Path
 from datetime import datetime
+from itertools import chain
 import multiprocessing as mp
-from typing import Dict, Any, Union
+import threading
+from concurrent.futures import (
+    Executor,
+    ProcessPoolExecutor,
+    ThreadPoolExecutor,
+    as_completed,
+)
+from concurrent.futures.process import BrokenProcessPool
+from typing import Dict, Any, List, Tuple, Union
 import time
 
 # Third party imports
 import pandas as pd
 import geopandas as gpd
 from osgeo import gdal
+import numpy as np
 import xarray as xr
+import dask.array as dask_array
 import rioxarray
-from shapely.geometry import mapping
+from shapely.geometry import mapping, shape
 from cubed.utils import parse_bandmap
 from cubed.client import generate_client
 
@@ -35,6 +46,11 @@ try:
 except ImportError:
     pass
 
+try:
+    import h5netcdf
+except ImportError:
+    h5netcdf = None
+
 rioxarray.set_options(export_grid_mapping=False)
 # Local imports
 # ...
@@ -45,21 +61,48 @@ ItemCollectionDict = Dict[str, Any]
 
 ######################################
 # Set up VSIcurl settings
-gdal.SetConfigOption("GDAL_HTTP_COOKIEFILE", "~/cookies.txt")
-gdal.SetConfigOption("GDAL_HTTP_COOKIEJAR", "~/cookies.txt")
-gdal.SetConfigOption("GDAL_DISABLE_READDIR_ON_OPEN", "YES")
-gdal.SetConfigOption("CPL_VSIL_CURL_ALLOWED_EXTENSIONS", "TIF")
+def _init_gdal() -> None:
+    """Apply VSIcurl settings"""
+    gdal.SetConfigOption("GDAL_HTTP_COOKIEFILE", "~/cookies.txt")
+    gdal.SetConfigOption("GDAL_HTTP_COOKIEJAR", "~/cookies.txt")
+    gdal.SetConfigOption("GDAL_DISABLE_READDIR_ON_OPEN", "YES")
+    gdal.SetConfigOption("CPL_VSIL_CURL_ALLOWED_EXTENSIONS", "TIF")
+    gdal.SetConfigOption("GDAL_HTTP_MULTIPLEX", "YES")
+    gdal.SetConfigOption("GDAL_HTTP_MERGE_CONSECUTIVE_RANGES", "YES")
+    gdal.SetConfigOption("CPL_VSIL_CURL_CHUNK_SIZE", "16384")
+    gdal.SetConfigOption("VSI_CACHE", "TRUE")
+    # VSI_CACHE_SIZE is per file handle, the curl block cache is global
+    gdal.SetConfigOption("VSI_CACHE_SIZE", "134217728")
+    gdal.SetConfigOption("CPL_VSIL_CURL_CACHE_SIZE", "2000000000")
+    gdal.SetConfigOption("GDAL_HTTP_VERSION", "2")
+    gdal.SetConfigOption("GDAL_INGESTED_BYTES_AT_OPEN", "32768")
+
+
+_init_gdal()
 ######################################
 
 #####################################
 # Consts
 PROCESSES = 8
+# Spatial chunking of band reads, chunks of a band are read in parallel
+CHUNKS = {"band": 1, "x": 1024, "y": 1024}
+# Below this many dates process startup outweighs the work, use threads
+THREAD_DATES = 4
+# Block size of cached GeoTiffs
+TILE_SIZE = 512
+# Band specific attributes kept as per band lists on stacked arrays
+BAND_ATTRS = ("scale_factor", "add_offset", "_FillValue")
+# Band reads are latency bound HTTP range requests, GDAL releases the GIL
+BAND_THREADS = 16
 
 CATALOGS = ["LPCLOUD"]
 
 
-def get_links(asset, band_map: Dict[str, str]) -> pd.DataFrame:
-    """Generate data frame of hrefs and meta data for a scene
+HREF_COLUMNS = ["date", "sat", "band", "cname", "href"]
+
+
+def get_links(asset, band_map: Dict[str, str]) -> List[Tuple]:
+    """Generate rows of hrefs and meta data for a scene
 
     Parameters
     ----------
@@ -70,8 +113,9 @@ def get_links(asset, band_map: Dict[str, str]) -> pd.DataFrame:
 
     Return
     -------
-    pandas.DataFrame
-        Pandas object which contains dates, collection, band, and href link
+    list
+        List of (date, collection, band, common name, href) tuples, one per
+        band asset
 
     Notes
     -----
@@ -79,24 +123,14 @@ def get_links(asset, band_map: Dict[str, str]) -> pd.DataFrame:
     Example
     -------
     """
-    data_dict = []
     sat = asset.collection_id
-    band_keys = list(band_map.get(sat).keys())
+    sat_map = band_map.get(sat)
     date = asset.datetime.date()
-    for idx, item in enumerate(asset.assets):
-        if item in band_keys:
-            cname = band_map.get(sat).get(item)
-            href = asset.assets.get(item).href
-            data_dict.append(
-                {
-                    "date": date,
-                    "sat": sat,
-                    "band": item,
-                    "cname": cname,
-                    "href": href,
-                }
-            )
-    return pd.DataFrame(data_dict)
+    return [
+        (date, sat, item, sat_map.get(item), asset.assets.get(item).href)
+        for item in asset.assets
+        if item in sat_map
+    ]
 
 
 def construct_file_df(
@@ -126,18 +160,20 @@ def construct_file_df(
     Example
     -------
     """
-    file_list = []
-    for i in files:
-        file_list.append(get_links(i, band_map))
-    href_df = pd.concat(file_list)
-    return href_df.sort_values(by=["date", "band"])
+    rows = list(chain.from_iterable(get_links(i, band_map) for i in files))
+    href_df = pd.DataFrame.from_records(rows, columns=HREF_COLUMNS)
+    # Low cardinality columns are dictionary encoded for cheap filtering
+    href_df["date"] = pd.to_datetime(href_df["date"])
+    for c in ("sat", "band", "cname"):
+        href_df[c] = href_df[c].astype("category")
+    return href_df.sort_values(by=["date", "band"], kind="mergesort", ignore_index=True)
 
 
 def generate_cube(
     hrefs: pd.DataFrame,
     geom: gpd.GeoDataFrame,
     processes: int = PROCESSES,
-    cache=True,
+    cache=False,
     cache_dir: Union[Path, str] = Path("./"),
 ) -> xr.core.dataarray.DataArray:
     """Create cube from ItemCollection
@@ -152,7 +188,7 @@ def generate_cube(
     processes : int
         Number of CPU cores to utilize
     cache : bool
-        Whether or not to cache all imgs as GeoTiffs
+        Whether or not to cache the cube as a netCDF file, requires h5netcdf
     cache_dir : Path
         Directory in which to output downloaded imagery if cache is true
 
@@ -164,29 +200,120 @@ def generate_cube(
 
     Notes
     -----
+        Each worker reads and clips the pixels of its date, so the network
+        reads of different dates run in parallel. With cache the cube is
+        written to cache_dir/cube_<start>_<end>.nc once all dates are read.
 
     Example
     -------
     """
-    dates = hrefs["date"].unique()
-    time = xr.Variable("time", dates)
-    # pool = mp.Pool(processes)
-    # imgs = pool.starmap(
-    #    band_stack,
-    #    [(hrefs.loc[hrefs["date"] == d], geom, cache, cache_dir) for d in dates],
-    # )
-
-    imgs = xr.concat(
-        [band_stack(hrefs.loc[hrefs["date"] == d], geom, False) for d in dates],
-        dim=time,
-    )
+    # Fail before downloading anything rather than at the final write
+    if cache and h5netcdf is None:
+        raise ImportError("Caching the cube requires h5netcdf")
+    # Single pass split of the hrefs by date
+    groups = dict(list(hrefs.groupby("date", sort=False)))
+    dates = list(groups)
+    time = xr.Variable("time", pd.DatetimeIndex(dates))
+    # Serialize the clip geometry once for every band and date
+    mapped_geom = list(geom.geometry.apply(mapping))
+    crs = geom.crs
+
+    args = (mapped_geom, crs, False, cache_dir)
+    if len(dates) <= THREAD_DATES:
+        with ThreadPoolExecutor(max_workers=processes) as ex:
+            imgs = _stack_dates(ex, groups, args)
+    else:
+        ex = _pool(processes)
+        try:
+            imgs = _stack_dates(ex, groups, args)
+        except BrokenProcessPool:
+            # A worker died (e.g. GDAL out of memory), don't reuse the pool
+            _reset_pool(ex)
+            raise
+
+    cube = xr.concat([imgs[d] for d in dates], dim=time)
+    if cache:
+        start, end = dates[0].date(), dates[-1].date()
+        cube_to_netcdf(cube, Path(cache_dir) / f"cube_{start}_{end}.nc")
+    return cube
+
+
+# Process pools reused across generate_cube calls, one per pool size, see _pool
+_POOLS: Dict[int, ProcessPoolExecutor] = {}
+_POOL_LOCK = threading.Lock()
+
+
+def _pool(processes: int) -> ProcessPoolExecutor:
+    """Shared process pool of a size, recreated when broken
+
+    Pools are kept per size instead of resizing one, so a call with a
+    different size never shuts down a pool another thread is submitting to.
+    Workers are spawned rather than forked, a forked worker inherits the
+    parent's dask thread pool without its threads and hangs on compute.
+    Spawned workers import cubed.download, which applies the VSIcurl
+    settings.
+    """
+    with _POOL_LOCK:
+        ex = _POOLS.get(processes)
+        if ex is None:
+            ex = ProcessPoolExecutor(
+                max_workers=processes, mp_context=mp.get_context("spawn")
+            )
+            _POOLS[processes] = ex
+        return ex
+
+
+def _reset_pool(ex: ProcessPoolExecutor) -> None:
+    """Drop a broken shared pool so the next call starts a fresh one"""
+    with _POOL_LOCK:
+        for processes, pooled in list(_POOLS.items()):
+            if pooled is ex:
+                del _POOLS[processes]
+    ex.shutdown(wait=False)
 
-    return imgs
+
+def _stack_dates(
+    ex: Executor, groups: Dict[Any, pd.DataFrame], args: Tuple
+) -> Dict[Any, xr.DataArray]:
+    """Run band_stack for each date group on an executor"""
+    # Collect results as each date finishes rather than gating on the slowest
+    futures = {
+        ex.submit(band_stack, href_df, *args): d for d, href_df in groups.items()
+    }
+    return {futures[fut]: fut.result() for fut in as_completed(futures)}
+
+
+def cube_to_netcdf(cube: xr.DataArray, out_path: Path) -> Path:
+    """Write cube to compressed netCDF with h5netcdf
+
+    Parameters
+    ----------
+    cube : xarray.DataArray
+        Cube with dimensions [time, band, y, x]
+    out_path : Path
+        Output netCDF path
+
+    Returns
+    -------
+    Path
+        Path of written netCDF
+    """
+    name = cube.name or "cube"
+    chunksizes = tuple(
+        min(CHUNKS.get(dim, 1), size) for dim, size in zip(cube.dims, cube.shape)
+    )
+    cube.to_dataset(name=name).to_netcdf(
+        out_path,
+        engine="h5netcdf",
+        encoding={name: {"zlib": True, "chunksizes": chunksizes}},
+    )
+    return out_path
 
 
 def band_stack(
     href_df: pd.DataFrame,
-    geoms: gpd.GeoDataFrame,
+    mapped_geom: List[Dict[str, Any]],
+    crs: Any,
     cache=True,
     cache_dir: Path = Path("./"),
 ) -> xr.Dataset:
@@ -196,8 +323,10 @@ def band_stack(
     ----------
     href_df : pandas.DataFrame
         Pandas object which contains dates, collection, band, and href link
-    geom : geopandas.GeoDataFrame
-        Geometry object to clip imagery to
+    mapped_geom : list
+        GeoJSON-like mappings of the geometries to clip imagery to
+    crs : Any
+        CRS of the clip geometries
     cache : bool
         Whether or not to cache all imgs as GeoTiffs
     cache_dir : Path
@@ -217,21 +346,155 @@ def band_stack(
     """
     bands = list(href_df.cname)
     band = xr.Variable("band", bands)
-    sat = href_df["sat"].unique()[0]
-    date = href_df["date"].unique()[0]
+    # href_df holds a single date, possibly of several scenes and collections
+    sat = href_df["sat"].iat[0]
+    date = href_df["date"].iat[0]
     print(f"{datetime.now()} {sat} {date}")
-    xr_arr = xr.concat(
-        [
-            rioxarray.open_rasterio(f, lock=False, chunks=(1, -1, "auto")).rio.clip(
-                geoms.geometry.apply(mapping),
-                geoms.crs,
-                from_disk=True,
-            )
-            for f in href_df.href
-        ],
-        dim=band,
-    )
+    bounds = _geom_bounds(mapped_geom)
+    hrefs = list(href_df.href)
+    with ThreadPoolExecutor(max_workers=min(BAND_THREADS, len(hrefs))) as ex:
+        futures = [
+            ex.submit(_open_and_clip, f, mapped_geom, crs, bounds) for f in hrefs
+        ]
+        xr_bands = [fut.result() for fut in futures]
+    # Read the pixels here so the pool workers do the I/O, not the caller
+    xr_arr = _stack_bands(xr_bands, band).compute()
     xr_arr.attrs["long_name"] = bands
     print(xr_arr.shape)
-    sat = href_df["sat"].unique()[0]
+    if cache:
+        out_path = Path(cache_dir) / f"{sat}_{date.date()}.tif"
+        write_tiled_raster(xr_arr, out_path)
     return xr_arr
+
+
+def write_tiled_raster(xr_arr: xr.DataArray, out_path: Path) -> Path:
+    """Write multiband array to a tiled, compressed GeoTiff
+
+    Parameters
+    ----------
+    xr_arr : xarray.DataArray
+        Array with dimensions [band, y, x]
+    out_path : Path
+        Output GeoTiff path
+
+    Returns
+    -------
+    Path
+        Path of written GeoTiff
+
+    Notes
+    -----
+        Data is written in its source dtype, per band scales and offsets are
+        carried into the band metadata, the shared nodata into the dataset
+        nodata and band names into the band descriptions. GDAL compresses
+        the blocks using all cores.
+    """
+    # Per band lists would be written as repr strings in the dataset tags
+    attrs = dict(xr_arr.attrs)
+    nodata = _common_nodata(attrs.pop("nodatas", []))
+    tags = {k: attrs.pop(k) for k in ("scales", "offsets") if k in attrs}
+    xr_arr = xr_arr.copy(deep=False)
+    xr_arr.attrs = attrs
+    if nodata is not None:
+        xr_arr = xr_arr.rio.write_nodata(nodata)
+    xr_arr.rio.to_raster(
+        out_path,
+        tiled=True,
+        blockxsize=TILE_SIZE,
+        blockysize=TILE_SIZE,
+        compress="deflate",
+        predictor=2 if np.issubdtype(xr_arr.dtype, np.integer) else 3,
+        num_threads="ALL_CPUS",
+        tags=tags,
+    )
+    return out_path
+
+
+def _common_nodata(nodatas: List[float]) -> Union[float, None]:
+    """Nodata shared by all bands with one, None if the bands differ"""
+    values = {v for v in nodatas if not np.isnan(v)}
+    if len(values) == 1:
+        return values.pop()
+    return None
+
+
+def _remap_nodata(data: Any, nodata: float, fill: float) -> Any:
+    """Replace a band's nodata pixels with the stack's fill value"""
+    if np.isnan(nodata) or np.isnan(fill) or nodata == fill:
+        return data
+    return dask_array.where(data == nodata, fill, data)
+
+
+def _stack_bands(xr_bands: List[xr.DataArray], band: xr.Variable) -> xr.DataArray:
+    """Stack clipped single band arrays along the band dimension
+
+    Bands of a scene share the same clipped grid, so their underlying
+    arrays are joined directly and wrapped once instead of going through
+    xr.concat's coordinate alignment. A date can hold several scenes (an
+    AOI spanning tiles), bands on differing grids are aligned by xr.concat.
+    """
+    first = xr_bands[0]
+    coords = {k: v for k, v in first.coords.items() if k != "band"}
+    coords["band"] = band
+    # Scale and offset differ between bands (e.g. Fmask), keep them per band
+    # instead of applying the first band's to the whole stack
+    attrs = {k: v for k, v in first.attrs.items() if k not in BAND_ATTRS}
+    attrs["scales"] = [b.attrs.get("scale_factor", 1.0) for b in xr_bands]
+    attrs["offsets"] = [b.attrs.get("add_offset", 0.0) for b in xr_bands]
+    # A GeoTiff holds one nodata, bands filled with another (Fmask's 255) take
+    # the fill of a band already in the stack dtype, 255 is a valid reflectance
+    dtype = np.result_type(*(b.dtype for b in xr_bands))
+    nodatas = [b.attrs.get("_FillValue", np.nan) for b in xr_bands]
+    fills = [v for b, v in zip(xr_bands, nodatas) if b.dtype == dtype]
+    fill = next((v for v in fills + nodatas if not np.isnan(v)), np.nan)
+    fill = fill if np.isnan(fill) else dtype.type(fill)
+    datas = [
+        _remap_nodata(b.data.astype(dtype), v, fill) for b, v in zip(xr_bands, nodatas)
+    ]
+    attrs["nodatas"] = [v if np.isnan(v) else fill for v in nodatas]
+    if not all(_same_grid(first, b) for b in xr_bands[1:]):
+        arrays = [b.copy(data=d) for b, d in zip(xr_bands, datas)]
+        # Pad with the stack's fill, keeping the integer dtype
+        padding = {} if np.isnan(fill) else {"fill_value": fill}
+        stack = xr.concat(
+            arrays,
+            dim=band,
+            join="outer",
+            coords="minimal",
+            compat="override",
+            **padding,
+        )
+        stack.attrs = attrs
+        return stack
+    # DataArray takes the dask graph name otherwise, keep the band's name
+    return xr.DataArray(
+        dask_array.concatenate(datas, axis=0),
+        coords=coords,
+        dims=first.dims,
+        attrs=attrs,
+    ).rename(first.name)
+
+
+def _same_grid(a: xr.DataArray, b: xr.DataArray) -> bool:
+    """Whether two arrays have the same x and y coordinates"""
+    return a.indexes["x"].equals(b.indexes["x"]) and a.indexes["y"].equals(
+        b.indexes["y"]
+    )
+
+
+def _geom_bounds(mapped_geom: List[Dict[str, Any]]) -> Tuple[float, ...]:
+    """Total (minx, miny, maxx, maxy) bounds of mapped geometries"""
+    minx, miny, maxx, maxy = zip(*(shape(g).bounds for g in mapped_geom))
+    return min(minx), min(miny), max(maxx), max(maxy)
+
+
+def _open_and_clip(href: str, mapped_geom, crs, bounds) -> xr.DataArray:
+    """Open a single band href and clip it to geometry
+
+    The bounding box clip slices the lazy dask array, which is what limits
+    GDAL to range requesting the COG blocks intersecting the geometry. The
+    polygon clip then masks the already small window in memory.
+    """
+    da = rioxarray.open_rasterio(href, lock=False, chunks=CHUNKS)
+    da = da.rio.clip_box(*bounds, crs=crs)
+    return da.rio.clip(mapped_geom, crs)
@@ -16,8 +16,8 @@ import numpy as np
 from pathlib import Path
 import rioxarray
 from datetime import datetime
+from functools import lru_cache
 import re
-import matplotlib.pyplot as plt
 import geopandas as gpd
 
 from cubed.date_glob import DateGlob
@@ -36,12 +36,13 @@ def dir_to_xarr(
             f"No files found in '{str(file_dir)}' with date '{date_expression}'"
         )
 
-    regexp = fr"{globexp.pattern}*|$"
+    date_re = re.compile(fr"{globexp.pattern}*|$")
+    # Many files share a date (one per band), only parse each date string once
+    parse_date = lru_cache(maxsize=None)(
+        lambda s: datetime.strptime(s, date_expression)
+    )
 
-    dates = [
-        datetime.strptime(re.search(regexp, str(f)).group(), date_expression)
-        for f in files
-    ]
+    dates = [parse_date(date_re.search(f.name).group()) for f in files]
     # Standard xarray convention seems to name all time variables as time, even just dates
     time = xr.Variable("time", dates)
     xr_arr = xr.concat(
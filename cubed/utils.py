@@ -1,10 +1,10 @@
 # Standard library imports
 
-import json
+from functools import lru_cache
 from pathlib import Path
 from datetime import datetime
 import multiprocessing as mp
-from typing import Dict, Any, Union
+from typing import Dict, Any, Mapping, Union
 import time
 
 # Third party imports
@@ -15,35 +15,52 @@ import xarray as xr
 import rioxarray
 from shapely.geometry import mapping
 
+from cubed._bandmap_data import BANDMAP
+
 
 try:
     from rich import print
 except ImportError:
     pass
 
+try:
+    from orjson import loads as _loads
+except ImportError:
+    from json import loads as _loads
+
 
 def parse_bandmap(
-    sat, path: Path = Path("./bandmap.json")
-) -> Union[Dict[str, str], None]:
-    """TODO: Docstring for parse_bandmap.
+    sat, path: Union[Path, str, None] = None
+) -> Union[Mapping[str, Any], None]:
+    """Look up the band map of a data product
 
     Parameters
     ----------
-    path : TODO
+    sat : str
+        Data product key in band map
+    path : Path, optional
+        Alternate band map json, defaults to the band map shipped with cubed
 
     Returns
     -------
-    TODO
+    Mapping
+        Read-only band map of data product shared between calls, None if
+        not in band map
 
     """
-    if not isinstance(path, Path):
-        try:
-            path = Path(path)
-        except TypeError:
-            print("Invalid path type")
-
-    with open(path.resolve(), "r") as fp:
-        band_map = json.load(fp)
+    band_map = _BANDMAP
+    if path is not None:
+        if not isinstance(path, Path):
+            try:
+                path = Path(path)
+            except TypeError:
+                print("Invalid path type")
+        path = path.resolve()
+        if path != BANDMAP_PATH:
+            band_map = _load_bandmap(path)
+    # Unknown collections in the packaged band map return without a lookup
+    if band_map is _BANDMAP and sat not in _KNOWN_COLLECTIONS:
+        return None
     try:
         sat_map = band_map.get(sat)
         return sat_map
@@ -52,6 +69,50 @@ def parse_bandmap(
         return None
 
 
+@lru_cache(maxsize=None)
+def _load_bandmap(path: Path) -> Mapping[str, Any]:
+    """Read and parse a band map json, once per path"""
+    with open(path, "rb") as fp:
+        return _freeze(_loads(fp.read()))
+
+
+class _FrozenDict(dict):
+    """Read-only, hashable dict
+
+    Stays a dict so results pickle, deepcopy and serialize to json like the
+    parsed band map.
+    """
+
+    __slots__ = ()
+
+    def _read_only(self, *args, **kwargs):
+        raise TypeError(f"{type(self).__name__} is read-only")
+
+    __setitem__ = __delitem__ = __ior__ = _read_only
+    clear = pop = popitem = setdefault = update = _read_only
+
+    def __hash__(self):
+        return hash(frozenset(self.items()))
+
+    def __reduce__(self):
+        # Rebuilt from a plain dict, item assignment is blocked
+        return (type(self), (dict(self),))
+
+
+def _freeze(obj: Any) -> Any:
+    """Make every nested dict read-only so results can be shared"""
+    if isinstance(obj, dict):
+        return _FrozenDict({k: _freeze(v) for k, v in obj.items()})
+    return obj
+
+
+# Band map shipped with the package, embedded as a python module generated
+# from bandmap.json by scripts/gen_bandmap.sh
+BANDMAP_PATH = (Path(__file__).parent / "bandmap.json").resolve()
+_BANDMAP = _freeze(BANDMAP)
+_KNOWN_COLLECTIONS = frozenset(_BANDMAP)
+
+
 def inv_bandmap(band_map: Dict[str, str]) -> Dict[str, str]:
     """Generate inverted band, common name dictonary
 
@@ -0,0 +1,14 @@
+#!/bin/bash
+# Regenerate cubed/_bandmap_data.py from cubed/bandmap.json, the json stays
+# the source of truth
+
+cd "$(dirname "$0")/.."
+python - <<'PY' > cubed/_bandmap_data.py
+import json
+import pprint
+
+with open("cubed/bandmap.json") as fp:
+    band_map = json.load(fp)
+print("# Generated from bandmap.json by scripts/gen_bandmap.sh, do not edit")
+print(f"BANDMAP = {pprint.pformat(band_map, sort_dicts=False)}")
+PY
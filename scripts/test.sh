@@ -1,5 +1,5 @@
 #!/bin/bash
 
-cd "$(.. "$0")"
-pytest  -W ignore::DeprecationWarning -vv
-
+# Requires pytest-xdist, skip network tests with: -m "not network"
+cd "$(dirname "$0")/.."
+pytest -n auto -W ignore::DeprecationWarning -vv "$@"
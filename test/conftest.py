@@ -0,0 +1,21 @@
+import pytest
+from cubed.client import generate_client
+from cubed.utils import parse_bandmap
+
+correct_stac = {"catalog": "LPCLOUD", "url": "https://cmr.earthdata.nasa.gov/stac/"}
+band_map_path = "./cubed/bandmap.json"
+
+
+def pytest_configure(config):
+    config.addinivalue_line("markers", "network: test requires network access")
+
+
+@pytest.fixture(scope="session")
+def stac_client():
+    return generate_client(**correct_stac)
+
+
+@pytest.fixture(scope="session")
+def band_map(request):
+    # Collection can be chosen with indirect parametrization
+    return parse_bandmap(getattr(request, "param", "HLSv2"), band_map_path)
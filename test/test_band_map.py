@@ -1,4 +1,8 @@
+import copy
+import json
+import pickle
 import pytest
+from cubed._bandmap_data import BANDMAP
 from cubed.utils import parse_bandmap
 
 
@@ -31,12 +35,36 @@ correct_band_map = {
 band_map_path = "./cubed/bandmap.json"
 
 
-def test_correct_band_map():
-    collection = "HLSv2"
-    band_map = parse_bandmap(collection, band_map_path)
-    assert band_map == correct_band_map.get(collection)
+@pytest.mark.parametrize(
+    "band_map,expected",
+    [("HLSv2", correct_band_map.get("HLSv2")), ("wrong", None)],
+    indirect=["band_map"],
+)
+def test_band_map(band_map, expected):
+    assert band_map == expected
 
 
-def test_incorrect_band_map():
-    band_map = parse_bandmap("wrong", band_map_path)
-    assert band_map == None
+def test_packaged_band_map():
+    assert parse_bandmap("HLSv2") == correct_band_map.get("HLSv2")
+
+
+def test_embedded_band_map_in_sync():
+    # cubed/_bandmap_data.py is regenerated by scripts/gen_bandmap.sh
+    with open(band_map_path) as fp:
+        assert BANDMAP == json.load(fp)
+
+
+def test_band_map_shareable():
+    band_map = parse_bandmap("HLSv2")
+    with pytest.raises(TypeError):
+        band_map["HLSL30.v2.0"]["B01"] = "coastal"
+    with pytest.raises(TypeError):
+        band_map.update(wrong={})
+    # Results can be hashed, copied, pickled for process pools and dumped
+    assert hash(band_map) == hash(parse_bandmap("HLSv2"))
+    assert copy.deepcopy(band_map) == band_map
+    unpickled = pickle.loads(pickle.dumps(band_map))
+    assert unpickled == band_map
+    with pytest.raises(TypeError):
+        unpickled["HLSL30.v2.0"]["B01"] = "coastal"
+    assert json.loads(json.dumps(band_map)) == correct_band_map.get("HLSv2")
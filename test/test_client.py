@@ -1,16 +1,120 @@
+import math
+from pathlib import Path
+from types import SimpleNamespace
+
 import pytest
-from cubed.client import generate_client
+import requests
+from pystac_client import Client
+from pystac_client.exceptions import APIError
+from shapely.geometry import Polygon, mapping, shape
+
+import cubed.client
+from cubed.client import POOL_SIZE, CubeClient, _simplify_subgeom, generate_client
 
 correct_stac = {"catalog": "LPCLOUD", "url": "https://cmr.earthdata.nasa.gov/stac/"}
 wrong_stac = {"catalog": "wrong", "url": "https://cmr.earthdata.nasa.gov/stac/"}
+test_poly = Path("./test/data/test_poly.geojson")
 
 
-def test_client_correct():
-    client = generate_client(**correct_stac)
-    assert client.id == correct_stac.get("catalog")
+def _feature_collection(geom):
+    return {"type": "FeatureCollection", "features": [{"geometry": mapping(geom)}]}
+
+
+@pytest.fixture
+def offline_client(monkeypatch):
+    # Parent search returns the kwargs it would have sent
+    monkeypatch.setattr(Client, "search", lambda self, **kwargs: kwargs)
+    return object.__new__(CubeClient)
+
+
+@pytest.fixture
+def opened(monkeypatch):
+    # Stub Client.open, recording urls, failing while `fail` is set
+    monkeypatch.setattr(cubed.client, "_CLIENT_CACHE", {})
+    opened = SimpleNamespace(urls=[], fail=False)
+
+    def fake_open(url):
+        opened.urls.append(url)
+        if opened.fail:
+            raise APIError("not found")
+        return SimpleNamespace(_stac_io=SimpleNamespace(session=requests.Session()))
 
+    monkeypatch.setattr(CubeClient, "open", fake_open)
+    return opened
 
+
+@pytest.mark.network
+def test_client_correct(stac_client):
+    assert stac_client.id == correct_stac.get("catalog")
+
+
+@pytest.mark.network
 @pytest.mark.filterwarnings("ignore:STAC endpoint")
 def test_client_wrong():
     client = generate_client(**wrong_stac)
     assert client == None
+
+
+def test_subgeom_small_unchanged():
+    geom = Polygon([(0, 0), (0.01, 0), (0.01, 0.01), (0, 0.01)])
+    assert shape(_simplify_subgeom(_feature_collection(geom))).equals(geom)
+
+
+def test_subgeom_simplified_superset():
+    # Large, densely vertexed circle-like AOI
+    n = 2000
+    angles = [2 * math.pi * i / n for i in range(n)]
+    geom = Polygon([(math.cos(a), math.sin(a)) for a in angles])
+    simple = shape(_simplify_subgeom(_feature_collection(geom)))
+    assert len(simple.exterior.coords) < n
+    assert simple.contains(geom)
+
+
+def test_search_intersects_path(offline_client):
+    kwargs = offline_client.search(intersects=test_poly)
+    assert kwargs["intersects"]["type"] == "Polygon"
+    assert "bbox" not in kwargs
+
+
+def test_search_use_bbox(offline_client):
+    kwargs = offline_client.search(intersects=test_poly, use_bbox=True)
+    assert "intersects" not in kwargs
+    assert kwargs["bbox"] == pytest.approx(
+        (-78.6681604385376, 35.76152279105242, -78.64738941192627, 35.77896766857883)
+    )
+
+
+def test_fetch_items_batched_in_order(offline_client, monkeypatch):
+    monkeypatch.setattr(cubed.client, "ID_BATCH", 2)
+    searches = []
+
+    def search(ids, collections):
+        searches.append(ids)
+        # Return each batch reversed to check the input order is restored
+        items = [SimpleNamespace(id=i) for i in reversed(ids) if i != "missing"]
+        return SimpleNamespace(items=lambda: iter(items))
+
+    offline_client.search = search
+    ids = ["a", "b", "c", "missing", "e"]
+    items = offline_client.fetch_items(ids, collections=["HLSL30.v2.0"])
+    assert sorted(searches) == [["a", "b"], ["c", "missing"], ["e"]]
+    assert [item.id for item in items] == ["a", "b", "c", "e"]
+    assert offline_client.fetch_items([]) == []
+
+
+def test_generate_client_cached(opened):
+    client = generate_client(**correct_stac)
+    assert generate_client(**correct_stac) is client
+    assert len(opened.urls) == 1
+    adapter = client._stac_io.session.get_adapter("https://cmr.earthdata.nasa.gov")
+    assert adapter._pool_maxsize == POOL_SIZE
+    assert adapter.max_retries.is_retry("POST", 503)
+
+
+@pytest.mark.filterwarnings("ignore:STAC endpoint")
+def test_generate_client_failure_not_cached(opened):
+    opened.fail = True
+    assert generate_client(**wrong_stac) is None
+    opened.fail = False
+    assert generate_client(**wrong_stac) is not None
+    assert len(opened.urls) == 2
@@ -0,0 +1,221 @@
+from datetime import datetime
+from types import SimpleNamespace
+
+import dask.array as dask_array
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+import pytest
+import rasterio
+import xarray as xr
+from rasterio.enums import Compression
+from rasterio.transform import from_origin
+from shapely.geometry import box, mapping
+import cubed.download
+from cubed.download import (
+    HREF_COLUMNS,
+    THREAD_DATES,
+    _geom_bounds,
+    _open_and_clip,
+    _pool,
+    _reset_pool,
+    band_stack,
+    construct_file_df,
+    cube_to_netcdf,
+    generate_cube,
+    get_links,
+)
+from cubed.utils import parse_bandmap
+
+CRS = "EPSG:32617"
+SIZE = 64
+# (band, common name, dtype, nodata, scale) of the HLS like test scenes
+BANDS = [
+    ("B04", "red", "int16", -9999, 0.0001),
+    ("Fmask", "fmask", "uint8", 255, 1.0),
+]
+
+
+def _asset(collection, date, bands):
+    assets = {b: SimpleNamespace(href=f"https://data/{b}.tif") for b in bands}
+    return SimpleNamespace(
+        collection_id=collection,
+        datetime=datetime.fromisoformat(date),
+        assets=assets,
+    )
+
+
+@pytest.fixture
+def files():
+    return [
+        _asset("HLSS30.v2.0", "2022-01-05T16:00:00", ["B8A", "browse", "B02"]),
+        _asset("HLSL30.v2.0", "2022-01-03T16:00:00", ["B05", "B02", "metadata"]),
+    ]
+
+
+def _write_scene(path, dtype, nodata, scale, value, origin=(500000, 4000000)):
+    data = np.full((1, SIZE, SIZE), value, dtype=dtype)
+    data[0, 0, :] = nodata
+    profile = dict(driver="GTiff", height=SIZE, width=SIZE, count=1, dtype=dtype)
+    transform = from_origin(*origin, 30, 30)
+    with rasterio.open(
+        path, "w", crs=CRS, transform=transform, nodata=nodata, **profile
+    ) as dst:
+        dst.write(data)
+        dst.scales = (scale,)
+
+
+@pytest.fixture(scope="module")
+def scenes(tmp_path_factory):
+    # href frame of local GeoTiffs, enough dates for the process pool path
+    root = tmp_path_factory.mktemp("scenes")
+    rows = []
+    for day in range(1, THREAD_DATES + 2):
+        date = pd.Timestamp(2022, 1, day)
+        for band, cname, dtype, nodata, scale in BANDS:
+            path = root / f"{band}_{day}.tif"
+            _write_scene(path, dtype, nodata, scale, day)
+            rows.append((date, "HLSL30.v2.0", band, cname, str(path)))
+    return pd.DataFrame.from_records(rows, columns=HREF_COLUMNS)
+
+
+@pytest.fixture(scope="module")
+def aoi():
+    return gpd.GeoDataFrame(geometry=[box(500060, 3998200, 501800, 4000000)], crs=CRS)
+
+
+@pytest.fixture(scope="module")
+def first_date(scenes):
+    return scenes[scenes["date"] == scenes["date"].iat[0]]
+
+
+def _band_stack(href_df, aoi, **kwargs):
+    return band_stack(href_df, list(aoi.geometry.apply(mapping)), aoi.crs, **kwargs)
+
+
+def test_get_links_skips_unmapped(files):
+    rows = get_links(files[0], parse_bandmap("HLSv2"))
+    assert [r[2] for r in rows] == ["B8A", "B02"]
+    assert rows[0][:4] == (
+        datetime(2022, 1, 5).date(),
+        "HLSS30.v2.0",
+        "B8A",
+        "nir",
+    )
+
+
+def test_construct_file_df(files):
+    href_df = construct_file_df(files, parse_bandmap("HLSv2"))
+    assert list(href_df.columns) == HREF_COLUMNS
+    assert pd.api.types.is_datetime64_dtype(href_df["date"])
+    for c in ("sat", "band", "cname"):
+        assert isinstance(href_df[c].dtype, pd.CategoricalDtype)
+    assert isinstance(href_df.index, pd.RangeIndex)
+    assert list(href_df.index) == list(range(4))
+    # Sorted by date then band, unmapped assets dropped
+    assert list(href_df["band"]) == ["B02", "B05", "B02", "B8A"]
+    assert list(href_df["cname"]) == ["blue", "nir", "blue", "nir"]
+    assert list(href_df["date"].dt.day) == [3, 3, 5, 5]
+
+
+def test_generate_cube_after_parent_compute(scenes, aoi):
+    # Forked workers inherited the parent's dask thread pool and hung
+    dask_array.ones(10, chunks=2).sum().compute()
+    cube = generate_cube(scenes, aoi, processes=2, cache=False)
+    assert cube.sizes["time"] == THREAD_DATES + 1
+
+
+def test_pool_per_size():
+    ex = _pool(1)
+    assert _pool(2) is not ex
+    assert _pool(1) is ex
+    # Another size leaves the first pool usable
+    assert ex.submit(abs, -1).result() == 1
+    _reset_pool(ex)
+    assert _pool(1) is not ex
+
+
+def test_generate_cube_cache(scenes, aoi, tmp_path):
+    pytest.importorskip("h5netcdf")
+    hrefs = scenes[scenes["date"] <= scenes["date"].iat[0]]
+    cube = generate_cube(hrefs, aoi, processes=2, cache=True, cache_dir=tmp_path)
+    out_path = tmp_path / "cube_2022-01-01_2022-01-01.nc"
+    with xr.open_dataset(out_path, engine="h5netcdf") as ds:
+        assert ds["cube"].dtype == cube.dtype
+        np.testing.assert_array_equal(ds["cube"].values, cube.values)
+
+
+def test_generate_cube_cache_requires_h5netcdf(scenes, aoi, tmp_path, monkeypatch):
+    monkeypatch.setattr(cubed.download, "h5netcdf", None)
+    # Raised before any band is read
+    monkeypatch.setattr(cubed.download, "band_stack", None)
+    with pytest.raises(ImportError, match="h5netcdf"):
+        generate_cube(scenes, aoi, cache=True, cache_dir=tmp_path)
+    assert not list(tmp_path.iterdir())
+
+
+def test_band_stack_nodata(first_date, aoi, tmp_path):
+    xr_arr = _band_stack(first_date, aoi, cache=True, cache_dir=tmp_path)
+    assert xr_arr.dtype == np.int16
+    assert xr_arr.attrs["scales"] == pytest.approx([0.0001, 1.0])
+    # Fmask's fill is remapped to the reflectance fill
+    assert xr_arr.attrs["nodatas"] == [-9999, -9999]
+    fmask = xr_arr.sel(band="fmask")
+    assert (fmask == -9999).any() and not (fmask == 255).any()
+    with rasterio.open(tmp_path / "HLSL30.v2.0_2022-01-01.tif") as src:
+        assert src.nodata == -9999
+        assert src.scales == pytest.approx((0.0001, 1.0))
+        assert src.descriptions == ("red", "fmask")
+        assert not {"scales", "offsets", "nodatas"} & set(src.tags())
+
+
+def test_band_stack_scenes_on_different_grids(first_date, aoi, tmp_path):
+    # Second scene of the same date starting 30 pixels east, inside the AOI
+    path = tmp_path / "B04_shifted.tif"
+    _write_scene(path, "int16", -9999, 0.0001, 7, origin=(500900, 4000000))
+    shifted = first_date.iloc[:1].assign(href=str(path))
+    href_df = pd.concat([first_date.iloc[:1], shifted], ignore_index=True)
+    xr_arr = _band_stack(href_df, aoi, cache=False)
+    assert xr_arr.dtype == np.int16
+    # Bands are aligned on the union of both grids, padded with the fill
+    assert xr_arr.x.equals(_band_stack(first_date, aoi, cache=False).x)
+    west = xr_arr.sel(x=xr_arr.x < 500900).values
+    assert (west[0, 1:] == 1).all()
+    assert (west[1] == -9999).all()
+    assert (xr_arr.sel(x=xr_arr.x > 500900).values[1, 1:] == 7).all()
+
+
+def test_open_and_clip(first_date, aoi):
+    mapped_geom = list(aoi.geometry.apply(mapping))
+    bounds = _geom_bounds(mapped_geom)
+    da = _open_and_clip(first_date.href.iat[0], mapped_geom, aoi.crs, bounds)
+    # Native dtype and scale are kept, no float promotion
+    assert da.dtype == np.int16
+    assert da.attrs["scale_factor"] == pytest.approx(0.0001)
+    minx, miny, maxx, maxy = da.rio.bounds()
+    assert minx >= bounds[0] and maxx <= bounds[2]
+    assert miny >= bounds[1] and maxy <= bounds[3]
+
+
+def test_write_tiled_raster_profile(first_date, aoi, tmp_path):
+    _band_stack(first_date, aoi, cache=True, cache_dir=tmp_path)
+    with rasterio.open(tmp_path / "HLSL30.v2.0_2022-01-01.tif") as src:
+        assert src.dtypes == ("int16", "int16")
+        assert src.profile["tiled"]
+        assert src.block_shapes == [(512, 512)] * 2
+        assert src.compression == Compression.deflate
+        assert src.tags(ns="IMAGE_STRUCTURE")["PREDICTOR"] == "2"
+
+
+@pytest.mark.parametrize("n_dates", [THREAD_DATES, THREAD_DATES + 1])
+def test_generate_cube(scenes, aoi, n_dates):
+    # THREAD_DATES dates run on threads, more on the process pool
+    dates = scenes["date"].unique()[:n_dates]
+    cube = generate_cube(scenes[scenes["date"].isin(dates)], aoi, processes=2)
+    assert cube.dims == ("time", "band", "y", "x")
+    assert cube.dtype == np.int16
+    assert list(cube.band.values) == ["red", "fmask"]
+    # Dates finish in any order, the cube follows the hrefs
+    assert list(cube.time.values) == list(dates)
+    red = cube.sel(band="red").isel(y=slice(1, None)).values
+    assert [np.unique(r).tolist() for r in red] == [[d] for d in range(1, n_dates + 1)]
@@ -1,5 +1,8 @@
+import copy
+import pickle
 import pytest
-from cubed.date_glob import DateGlob
+import cubed.date_glob
+from cubed.date_glob import DateGlob, DateGlobSet
 
 
 def test_glob_date1():
@@ -21,3 +24,66 @@ def test_glob_date_fail():
     correct_pattern = "[0-9][0-9][0-9][0-9][0-9][0-9][0-9][0-9]"
     pattern = DateGlob(date_str)
     assert pattern.pattern != correct_pattern
+
+
+def test_glob_date_cached():
+    date_str = "%Y-%m-%d"
+    assert DateGlob(date_str) is DateGlob(date_str)
+    with pytest.raises(AttributeError):
+        DateGlob(date_str).pattern = "*"
+
+
+def test_glob_date_match():
+    pattern = DateGlob("%Y-%m-%d")
+    assert pattern.match("2022-01-31")
+    assert not pattern.match("20220131")
+
+
+def test_glob_date_slots():
+    assert not hasattr(DateGlob("%Y-%m-%d"), "__dict__")
+
+
+def _check_glob_date_set():
+    globs = DateGlobSet([DateGlob("%Y-%m-%d"), DateGlob("%Y%m%d")])
+    names = ["2022-01-31", "20220131", "2022_01_31", "x2022-01-31"]
+    assert globs.match_all(names) == {"2022-01-31": 0, "20220131": 1}
+
+
+def test_glob_date_set_regex(monkeypatch):
+    monkeypatch.setattr(cubed.date_glob, "hyperscan", None)
+    _check_glob_date_set()
+
+
+def test_glob_date_set_hyperscan(monkeypatch):
+    hyperscan = pytest.importorskip("hyperscan")
+    monkeypatch.setattr(cubed.date_glob, "hyperscan", hyperscan)
+    _check_glob_date_set()
+
+
+def test_glob_date_set_empty():
+    with pytest.raises(ValueError):
+        DateGlobSet([])
+
+
+def test_glob_date_literal():
+    pattern = DateGlob("HLS.L30")
+    assert pattern.pattern == "HLS.L30"
+    assert pattern.match("HLS.L30")
+    assert not pattern.match("HLSxL30")
+
+
+def test_glob_date_copy_pickle():
+    pattern = DateGlob("%Y-%m-%d")
+    assert copy.copy(pattern) is pattern
+    assert copy.deepcopy(pattern) is pattern
+    assert pickle.loads(pickle.dumps(pattern)).pattern == pattern.pattern
+
+
+def test_glob_date_literal_subclass():
+    class SubGlob(DateGlob):
+        __slots__ = ()
+
+    pattern = SubGlob("HLS.L30")
+    assert type(pattern) is SubGlob
+    assert pattern.match("HLS.L30")
+    assert copy.copy(pattern) is pattern